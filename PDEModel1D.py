@@ -1,6 +1,12 @@
 from abc import ABC, abstractmethod # ABC = "Abstract base class"
+import numpy as np
 
 class PDEModel1D(ABC):
+
+  # Models whose Jacobian is the same at every point should set this to 
+  # True, which lets the stepper evaluate it only once.
+  is_constant = False
+
   def __init__(self, numVars): 
     self.numVars = numVars
 
@@ -20,6 +26,16 @@ class PDEModel1D(ABC):
     '''Return the Jacobian at position x'''
     pass
 
+  def jacobians(self, X):
+    '''
+    Return the Jacobians at every point in the vector X as an nx+1 by
+    numVars by numVars array. The i-th entry is the Jacobian at X[i].
+
+    Models with a closed form for the Jacobian may override this with
+    a vectorized version.
+    '''
+    return np.array([self.jacobian(x) for x in X])
+
   @abstractmethod
   def jacEigensystem(self, x):
     '''
@@ -40,11 +56,22 @@ class PDEModel1D(ABC):
     '''
     pass
 
+  def jacEigenvalues_all(self, X):
+    '''
+    Return the eigenvalues of the Jacobian at every point in the vector X
+    as an nx+1 by numVars array. The i-th row holds the eigenvalues at X[i].
+
+    Models with a closed form for the eigenvalues may override this with
+    a vectorized version.
+    '''
+    return np.array([self.jacEigenvalues(x) for x in X])
+
 
   @abstractmethod
   def applyLeftBC(self, x, t, dx, dt, u_prev):
     '''
     Do whatever is needed to obtain u_cur at the left boundary point.
+    Returns the solution there as a 1D array of length numVars.
     
     Arguments are:
       *) x -- location of left boundary point
@@ -60,6 +87,7 @@ class PDEModel1D(ABC):
   def applyRightBC(self, x, t, dx, dt, u_prev):
     '''
     Do whatever is needed to obtain u_cur at the right boundary point.
+    Returns the solution there as a 1D array of length numVars.
     
     Arguments are:
       *) x -- location of right boundary point
@@ -1,4 +1,5 @@
 from abc import abstractmethod # ABC = "Abstract base class"
+import numpy as np
 from PDEModel1D import PDEModel1D
 
 class PDEModel1DWithExactSoln(PDEModel1D):
@@ -14,4 +15,15 @@ class PDEModel1DWithExactSoln(PDEModel1D):
     the values for the i-th variable at all grid points. The j-th column
     contains all variables at grid point j.
     '''
-    pass
\ No newline at end of file
+    pass
+
+  def exact_solution_batch(self, X, t_arr):
+    '''
+    Evaluate the exact solution at every point in the vector X and at every
+    time in the vector t_arr. Returns a T by numVars by nx+1 array, where T
+    is the number of times, whose k-th entry is exact_solution(X, t_arr[k]).
+
+    Models with a closed form for the solution may override this with a 
+    vectorized version.
+    '''
+    return np.array([self.exact_solution(X, t) for t in t_arr])
@@ -4,20 +4,12 @@ import matplotlib.pyplot as plt
 def error_rate(Nx, error):
     """Compute the error rate."""
 
-    # Compute the logs of the nodes and the errors
-    logNx = np.log(np.array(Nx))
-    logError = np.log(np.array(error))
-    ones = np.ones(len(logNx))
+    # Fit a line to log(error) vs log(Nx) by least squares. The slope is
+    # the error rate. polyfit solves the least squares problem directly
+    # rather than through the normal equations.
+    slope, _ = np.polyfit(np.log(Nx), np.log(error), 1)
 
-    V = np.array([ones, logNx]).transpose()
-
-    # Solve least squares system
-    A = np.matmul(V.transpose(), V)
-    b = np.matmul(V.transpose(), logError)
-
-    c = np.linalg.solve(A, b)
-
-    return c[1]
+    return slope
 
 
 if __name__ == '__main__':
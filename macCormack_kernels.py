@@ -0,0 +1,168 @@
+'''
+Compiled kernels for MacCormackStepper. These are plain numeric loops over
+the grid, compiled with numba: mac_step (and mac_step2, its version for 
+two variables) for the CPU, and mac_predictor_cuda/mac_corrector_cuda for
+NVIDIA GPUs. If numba is not installed, HAVE_NUMBA is False and the 
+stepper falls back to its NumPy implementation.
+
+All arrays follow the stepper's layout: solutions are numVars by nx+1, and
+the Jacobians are numVars by numVars by nx+1.
+'''
+import numpy as np
+
+try:
+  import numba
+  from numba import cuda
+  HAVE_NUMBA = True
+except ImportError:
+  HAVE_NUMBA = False
+
+
+# Number of grid points handled by each parallel tile in mac_step
+TILE = 64
+
+# Threads per block for the CUDA kernels
+CUDA_TPB = 128
+
+
+if HAVE_NUMBA:
+
+  @numba.njit(parallel=True, fastmath=True, cache=True)
+  def mac_step(u_prev, u_cur, J_all, dx, dt):
+    '''
+    Do one MacCormack step at the interior points 1 through nx-1, with 
+    the predictor and corrector fused into a single pass.
+
+    The interior is split into tiles of TILE points that are processed in
+    parallel. Each tile first computes the predicted values it needs 
+    (its own points plus the one to its left) into a small local scratch
+    array, then immediately applies the corrector from that scratch. The
+    predicted solution is never written back to a full-size array.
+
+    On entry u_cur[:, 0] must already hold the new left boundary value,
+    which doubles as the predicted value at point 0. The right boundary 
+    column of u_cur is left for the caller to fill in.
+    '''
+    numVars = u_prev.shape[0]
+    nx = u_prev.shape[1] - 1
+    n_tiles = (nx - 1 + TILE - 1)//TILE
+
+    for b in numba.prange(n_tiles):
+      i0 = 1 + b*TILE
+      i1 = min(i0 + TILE, nx)
+
+      # Predictor: forward differences at points i0-1 through i1-1. Row j
+      # of u_pred holds the predicted value at point i0-1+j.
+      u_pred = np.empty((i1 - i0 + 1, numVars), u_prev.dtype)
+      for i in range(i0 - 1, i1):
+        j = i - i0 + 1
+        if i == 0:
+          for k in range(numVars):
+            u_pred[j, k] = u_cur[k, 0]
+        else:
+          for k in range(numVars):
+            s = 0.0
+            for l in range(numVars):
+              s += J_all[k, l, i]*(u_prev[l, i+1] - u_prev[l, i])/dx
+            u_pred[j, k] = u_prev[k, i] - dt*s
+
+      # Corrector: backward differences on the predicted values
+      for i in range(i0, i1):
+        j = i - i0 + 1
+        for k in range(numVars):
+          s = 0.0
+          for l in range(numVars):
+            s += J_all[k, l, i]*(u_pred[j, l] - u_pred[j-1, l])/dx
+          u_cur[k, i] = 0.5*(u_pred[j, k] + u_prev[k, i]) - 0.5*dt*s
+
+  @numba.njit(parallel=True, fastmath=True, cache=True)
+  def mac_step2(u_prev, u_cur, J_all, dx, dt):
+    '''
+    Same as mac_step, specialized to numVars == 2. The 2x2 matrix-vector
+    products are written out by hand, and the predicted values at the 
+    current and previous point are carried in scalars instead of a 
+    scratch array.
+    '''
+    nx = u_prev.shape[1] - 1
+    n_tiles = (nx - 1 + TILE - 1)//TILE
+
+    for b in numba.prange(n_tiles):
+      i0 = 1 + b*TILE
+      i1 = min(i0 + TILE, nx)
+
+      # Predicted value (p0, p1) at the point to the left of the tile
+      i = i0 - 1
+      if i == 0:
+        p0 = u_cur[0, 0]
+        p1 = u_cur[1, 0]
+      else:
+        d0 = (u_prev[0, i+1] - u_prev[0, i])/dx
+        d1 = (u_prev[1, i+1] - u_prev[1, i])/dx
+        p0 = u_prev[0, i] - dt*(J_all[0, 0, i]*d0 + J_all[0, 1, i]*d1)
+        p1 = u_prev[1, i] - dt*(J_all[1, 0, i]*d0 + J_all[1, 1, i]*d1)
+
+      for i in range(i0, i1):
+        J00 = J_all[0, 0, i]
+        J01 = J_all[0, 1, i]
+        J10 = J_all[1, 0, i]
+        J11 = J_all[1, 1, i]
+
+        # Predictor at i
+        d0 = (u_prev[0, i+1] - u_prev[0, i])/dx
+        d1 = (u_prev[1, i+1] - u_prev[1, i])/dx
+        q0 = u_prev[0, i] - dt*(J00*d0 + J01*d1)
+        q1 = u_prev[1, i] - dt*(J10*d0 + J11*d1)
+
+        # Corrector at i from the predicted values at i-1 and i
+        d0 = (q0 - p0)/dx
+        d1 = (q1 - p1)/dx
+        u_cur[0, i] = 0.5*(q0 + u_prev[0, i]) - 0.5*dt*(J00*d0 + J01*d1)
+        u_cur[1, i] = 0.5*(q1 + u_prev[1, i]) - 0.5*dt*(J10*d0 + J11*d1)
+
+        p0 = q0
+        p1 = q1
+
+  @cuda.jit
+  def mac_predictor_cuda(u_prev, u_pred, J_all, bc, dx, dt):
+    '''
+    MacCormack predictor on the GPU, one thread per grid point. Thread 0 
+    copies the new left boundary value bc[:, 0] into u_pred, where the
+    corrector's backward difference at point 1 reads it.
+    '''
+    numVars = u_prev.shape[0]
+    nx = u_prev.shape[1] - 1
+    i = cuda.grid(1)
+
+    if i == 0:
+      for k in range(numVars):
+        u_pred[k, 0] = bc[k, 0]
+    elif i < nx:
+      for k in range(numVars):
+        s = 0.0
+        for l in range(numVars):
+          s += J_all[k, l, i]*(u_prev[l, i+1] - u_prev[l, i])/dx
+        u_pred[k, i] = u_prev[k, i] - dt*s
+
+  @cuda.jit
+  def mac_corrector_cuda(u_prev, u_pred, u_cur, J_all, bc, dx, dt):
+    '''
+    MacCormack corrector on the GPU, one thread per grid point. The 
+    threads at the two ends copy the boundary values bc[:, 0] and bc[:, 1]
+    into u_cur.
+    '''
+    numVars = u_prev.shape[0]
+    nx = u_prev.shape[1] - 1
+    i = cuda.grid(1)
+
+    if i == 0:
+      for k in range(numVars):
+        u_cur[k, 0] = bc[k, 0]
+    elif i == nx:
+      for k in range(numVars):
+        u_cur[k, nx] = bc[k, 1]
+    elif i < nx:
+      for k in range(numVars):
+        s = 0.0
+        for l in range(numVars):
+          s += J_all[k, l, i]*(u_pred[l, i] - u_pred[l, i-1])/dx
+        u_cur[k, i] = 0.5*(u_pred[k, i] + u_prev[k, i]) - 0.5*dt*s
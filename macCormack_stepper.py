@@ -1,17 +1,21 @@
 import numpy as np
 import numpy.linalg as la
-import matplotlib.pyplot as plt
-from copy import deepcopy
 from OutputHandler import OutputHandler
 from Grid1D import Grid1D
+from macCormack_kernels import HAVE_NUMBA
+if HAVE_NUMBA:
+  from numba import cuda
+  from macCormack_kernels import (mac_step, mac_step2, mac_predictor_cuda, 
+                                  mac_corrector_cuda, CUDA_TPB)
 
 
 
 class MacCormackStepper:
     '''
     MacCormackStepper drives a run of MacCormack's method. The results 
-    are stored in a list "history", each entry in which is a tuple 
-    (time, solution). 
+    are stored in preallocated arrays hist_t (times) and hist_U (solutions),
+    and are also available as a list "history", each entry in which is a 
+    tuple (time, solution). 
 
     Attributes of this class are:
     *) grid -- a Grid1D object that stores spatial discretization information
@@ -20,23 +24,96 @@ class MacCormackStepper:
     *) epsilon -- safety factor for CFL condition on timestep. The timestep 
        will be dt = epsilon * dx / max(lambda), where max(lambda) is the max
        eigenvalue of the Jacobians at all grid points. Defaults to 0.25.
-    *) history -- list of (time, solution) tuples filled in during the call to
-       run(). 
+    *) hist_t -- 1D array of the times stored during the call to run().
+    *) hist_U -- array of the solutions stored during the call to run(), 
+       of shape (number of stored steps, numVars, nx+1). hist_U[k] is the
+       solution at time hist_t[k].
+    *) history -- list of (time, solution) tuples built from hist_t and 
+       hist_U. 
+    *) use_jit -- if True, do the predictor and corrector sweeps in a 
+       numba-compiled kernel. Defaults to True when numba is installed; 
+       otherwise the sweeps are done with vectorized NumPy.
+    *) device -- 'cpu' (the default) or 'cuda'. With 'cuda' the predictor 
+       and corrector run as numba CUDA kernels on the GPU, with the 
+       solution kept on the device between steps. Only the boundary values 
+       are sent each step, and the new solution is copied back to be 
+       stored in the history and passed to the boundary conditions. This 
+       pays off for large grids (nx in the thousands); use_jit is ignored.
+    *) dtype -- floating point type of the solution arrays, the Jacobians,
+       and the stored history. Defaults to np.float64. np.float32 halves 
+       the memory traffic and the size of the history, and is accurate 
+       enough as long as the discretization error stays well above 
+       single precision roundoff.
     '''
-    def __init__(self, grid=Grid1D(), epsilon=0.25, model=None):
+    def __init__(self, grid=Grid1D(), epsilon=0.25, model=None, 
+                 use_jit=HAVE_NUMBA, device='cpu', dtype=np.float64):
       '''
-      Constructor. Takes the grid, model, and epsilon as keyword arguments. 
-      Call as, e.g., 
+      Constructor. Takes the grid, model, epsilon, use_jit, device, and 
+      dtype as keyword arguments. Call as, e.g., 
           stepper = MacCormackStepper(grid=myGrid, epsilon=0.25, model=myModel)
       '''
       assert model != None, 'please supply a model to the stepper'
+      assert HAVE_NUMBA or not use_jit, 'use_jit=True requires numba'
+      assert device in ('cpu', 'cuda'), 'device must be cpu or cuda'
+      assert device == 'cpu' or (HAVE_NUMBA and cuda.is_available()), \
+        'device=cuda requires numba and a CUDA GPU'
 
       # The only thing that needs doing is to record the grid, model, and 
-      # epsilon, and then to create an empty history list.
+      # epsilon, and then to create an empty history.
       self.grid = grid
       self.model = model
       self.epsilon = epsilon
-      self.history = []
+      self.use_jit = use_jit
+      self.device = device
+      self.dtype = np.dtype(dtype)
+
+      # For a constant-coefficient model, evaluate the Jacobian and the 
+      # largest wave speed once here rather than at every grid point.
+      self.is_constant = getattr(model, 'is_constant', False)
+      if self.is_constant:
+        self._J0 = model.jacobian(grid.xMin).astype(self.dtype)
+        self._lambda_max = np.max(np.abs(model.jacEigenvalues(grid.xMin)))
+
+      self._hist_t = np.empty(0)
+      self._hist_U = np.empty((0, model.numVars, grid.nx+1), self.dtype)
+      self._n_hist = 0
+
+    @property
+    def hist_t(self):
+      '''Times stored during the last run.'''
+      return self._hist_t[:self._n_hist]
+
+    @property
+    def hist_U(self):
+      '''Solutions stored during the last run, one per entry of hist_t.'''
+      return self._hist_U[:self._n_hist]
+
+    @property
+    def history(self):
+      '''
+      List of (time, solution) tuples stored during the last run. The 
+      solutions are views into hist_U, not copies.
+      '''
+      return [(self._hist_t[k], self._hist_U[k]) 
+              for k in range(self._n_hist)]
+
+    def _precompute_jacobians(self, X):
+      '''
+      Evaluate the model's Jacobian at every point of X. Returns a numVars
+      by numVars by nx+1 array J_all, where J_all[:, :, i] is the Jacobian 
+      at X[i]. 
+
+      The grid index is last so that each Jacobian entry J_all[k, l, :] is
+      contiguous along the grid, matching the layout of the solution 
+      arrays. For a constant-coefficient model this is a read-only 
+      broadcast view of the single cached Jacobian.
+      '''
+      numVars = self.model.numVars
+      if self.is_constant:
+        return np.broadcast_to(self._J0[:, :, np.newaxis], 
+                               (numVars, numVars, len(X)))
+      return np.ascontiguousarray(np.moveaxis(self.model.jacobians(X), 0, -1),
+                                  dtype=self.dtype)
 
     def run(self, t_init, t_final, u_init): 
       '''
@@ -50,11 +127,13 @@ class MacCormackStepper:
       #
       # Each of these will be numVars by nx+1 arrays. The i-th row contains
       # the values for the i-th variable at all grid points. The j-th column
-      # contains all variables at grid point j.
+      # contains all variables at grid point j. The rows are contiguous, so
+      # the finite difference stencils, which run along the grid, stream
+      # through memory.
 
-      u_prev = np.zeros((self.model.numVars, grid.nx+1))
-      u_pred = np.zeros((self.model.numVars, grid.nx+1))
-      u_cur = np.zeros((self.model.numVars, grid.nx+1))
+      u_prev = np.zeros((self.model.numVars, self.grid.nx+1), self.dtype)
+      u_pred = np.zeros((self.model.numVars, self.grid.nx+1), self.dtype)
+      u_cur = np.zeros((self.model.numVars, self.grid.nx+1), self.dtype)
 
       # Copy the initial value into the current value array. Use 
       # np.copyto(destination, source) to do the copy, thereby avoiding an 
@@ -72,14 +151,91 @@ class MacCormackStepper:
       X = self.grid.X
       model = self.model
 
+      # The Jacobian depends only on position, so evaluate it at every grid
+      # point once for the whole run. J_int holds the Jacobians at the 
+      # interior points 1 through nx-1, which is where the stencils live.
+      J_all = self._precompute_jacobians(X)
+      J_int = J_all[:, :, 1:nx]
+
+      # The predictor and corrector apply the Jacobian at every interior 
+      # point at once as a batched matrix-vector product,
+      #     rhs[:, i] = J_int[:, :, i] @ dUdx[:, i],
+      # written as an einsum. With only two operands there is a single 
+      # contraction, so there is no path to optimize: the default 
+      # (optimize=False) goes straight to NumPy's C implementation, while 
+      # passing a precomputed einsum_path routes every call through the 
+      # slower Python-level contraction machinery.
+      matvec = 'kli,li->ki'
+
+      # Work arrays for the NumPy predictor and corrector, allocated once so
+      # the stencils can be evaluated in place without temporaries, and 
+      # views of the interior and shifted slices the stencils read.
+      dUdx = np.empty((model.numVars, nx-1), self.dtype)
+      rhs = np.empty_like(dUdx)
+      u_prev_int = u_prev[:, 1:nx]
+      u_prev_right = u_prev[:, 2:nx+1]
+      u_pred_int = u_pred[:, 1:nx]
+      u_pred_left = u_pred[:, 0:nx-1]
+      u_cur_int = u_cur[:, 1:nx]
+      u_cur_right = u_cur[:, 2:nx+1]
+
+      # Find the largest wave speed for the CFL condition. Like the 
+      # Jacobian, the eigenvalues depend only on position, so this is also
+      # done once for the whole run rather than at every step.
+      if self.is_constant:
+        lambda_max = self._lambda_max
+      else:
+        evs = model.jacEigenvalues_all(X)
+        lambda_max = np.max(np.abs(evs))
+
       # -------------------------------------------------------------------
-      # Prepare for the run: initialize n_steps to zero, clear the history
-      # list, and deep copy the current (initial) (time, soln) tuple into the
-      # history list.  
+      # Prepare for the run: initialize n_steps to zero, allocate the 
+      # history buffers, and copy the current (initial) time and solution
+      # into the first slot. 
+      #
+      # Every step but the last has size epsilon*dx/lambda_max, so that 
+      # gives the number of steps up front. Keep a few spare slots to 
+      # absorb roundoff in the time accumulation.
 
       n_steps = 0
-      self.history.clear()
-      self.history.append((t, deepcopy(u_cur)))
+      dt_min = self.epsilon * (dx / lambda_max)
+      max_steps = int(np.ceil((t_final - t_init) / dt_min)) + 16
+      hist_t = np.empty(max_steps+1)
+      hist_U = np.empty((max_steps+1, model.numVars, nx+1), self.dtype)
+
+      hist_t[0] = t
+      np.copyto(hist_U[0], u_cur)
+      k = 1
+
+      # Bind everything the stepping loop uses to locals, so the loop does
+      # no attribute lookups on self, model, or np.
+      use_jit = self.use_jit
+      applyLeftBC = model.applyLeftBC
+      applyRightBC = model.applyRightBC
+      x_left = X[0]
+      x_right = X[-1]
+      numVars = model.numVars
+      einsum = np.einsum
+      copyto = np.copyto
+      add = np.add
+      subtract = np.subtract
+      divide = np.divide
+
+      # On the GPU, keep the Jacobians and the solution resident on the
+      # device for the whole run. The device arrays for the previous and 
+      # current solutions swap roles after every step. bc carries the two 
+      # boundary values to the device.
+      on_gpu = self.device == 'cuda'
+      if use_jit:
+        step_kernel = mac_step2 if numVars == 2 else mac_step
+      if on_gpu:
+        blocks = (nx + CUDA_TPB)//CUDA_TPB
+        d_J = cuda.to_device(np.ascontiguousarray(J_all))
+        d_u_prev = cuda.to_device(u_cur)
+        d_u_pred = cuda.device_array_like(u_cur)
+        d_u_cur = cuda.device_array_like(u_cur)
+        bc = np.empty((numVars, 2), self.dtype)
+        d_bc = cuda.device_array_like(bc)
 
       # -------------------------------------------------------------------
       #        Main MacCormack stepping loop
@@ -88,18 +244,15 @@ class MacCormackStepper:
 
           n_steps = n_steps + 1
 
-          # Deep copy the current solution into the previous solution array
-          np.copyto(u_prev, u_cur)  
+          # The current solution becomes the previous one. u_prev is only 
+          # read during a step and every entry of u_cur is overwritten, so
+          # swapping the two arrays (and their views) replaces a copy.
+          u_prev, u_cur = u_cur, u_prev
+          u_prev_int, u_cur_int = u_cur_int, u_prev_int
+          u_prev_right, u_cur_right = u_cur_right, u_prev_right
           
-          # Find the CFL compliant stepsize
-          lambda_max = 0.0
-          for x in (X):
-              lam = model.jacEigenvalues(x)
-              abs_of_ews = np.fabs(lam)
-              local_lambda_max = np.amax(abs_of_ews)
-              lambda_max = max(lambda_max, local_lambda_max)
-      
-          dt = self.epsilon * (dx / lambda_max)
+          # Use the CFL compliant stepsize
+          dt = dt_min
 
           # Adjust the time step in case we are about to hit the final time 
           if t_final - t <= dt:
@@ -108,96 +261,171 @@ class MacCormackStepper:
           # Update the time t_step to the end of the time step
           t_step = t + dt
 
-          # Predictor step
-          for i in range(1, nx):
-            dudx = (u_prev[:, i+1] - u_prev[:, i])/dx
-            J = model.jacobian(X[i])
-            u_pred[:,i] = u_prev[:,i] - dt*np.matmul(J,np.transpose(dudx)) 
-               
-          # Apply left boundary condition
-          u_cur[:, 0] = np.transpose(
-             model.applyLeftBC(X[0], t_step, dx, dt, u_prev)
-             )
-          np.copyto(u_pred[:,0],u_cur[:, 0])
-
-          # Corrector step
-          for i in range(1, nx):
-            dudx = (u_pred[:, i] - u_pred[:, i-1])/dx
-            J = self.model.jacobian(X[i])
-            uMid = 0.5*(u_pred[:,i] + u_prev[:,i])
-            u_cur[:,i] = uMid - 0.5*dt*np.matmul(J,np.transpose(dudx)) 
-
-          # Apply right boundary condition 
-          u_cur[:, -1] = np.transpose(
-             model.applyRightBC(X[-1], t_step, dx, dt, u_prev)
-             )
+          # Apply the boundary conditions. These only read u_prev, so they 
+          # can be done before the predictor. The corrector's backward 
+          # difference at point 1 needs the left value as the predicted 
+          # value at 0.
+          u_cur[:, 0] = applyLeftBC(x_left, t_step, dx, dt, u_prev)
+          u_cur[:, -1] = applyRightBC(x_right, t_step, dx, dt, u_prev)
+
+          if on_gpu:
+            # Send the boundary values, run the predictor and corrector on
+            # the device, and bring the new solution back
+            bc[:, 0] = u_cur[:, 0]
+            bc[:, 1] = u_cur[:, -1]
+            d_bc.copy_to_device(bc)
+            mac_predictor_cuda[blocks, CUDA_TPB](d_u_prev, d_u_pred, d_J, 
+                                                 d_bc, dx, dt)
+            mac_corrector_cuda[blocks, CUDA_TPB](d_u_prev, d_u_pred, d_u_cur,
+                                                 d_J, d_bc, dx, dt)
+            d_u_cur.copy_to_host(u_cur)
+            d_u_prev, d_u_cur = d_u_cur, d_u_prev
+          elif use_jit:
+            # Predictor and corrector fused in one compiled kernel
+            step_kernel(u_prev, u_cur, J_all, dx, dt)
+          else:
+            u_pred[:, 0] = u_cur[:, 0]
+
+            # Predictor step (forward differences at all interior points)
+            subtract(u_prev_right, u_prev_int, out=dUdx)
+            divide(dUdx, dx, out=dUdx)
+            einsum(matvec, J_int, dUdx, out=rhs)
+            rhs *= dt
+            subtract(u_prev_int, rhs, out=u_pred_int)
+
+            # Corrector step (backward differences at all interior points)
+            subtract(u_pred_int, u_pred_left, out=dUdx)
+            divide(dUdx, dx, out=dUdx)
+            einsum(matvec, J_int, dUdx, out=rhs)
+            rhs *= 0.5*dt
+            add(u_pred_int, u_prev_int, out=u_cur_int)
+            u_cur_int *= 0.5
+            u_cur_int -= rhs
 
           # Update the time
           t = t_step
 
-          # Store the results
-          self.history.append((t, deepcopy(u_cur)))
+          # Store the results, growing the buffers if the estimate of the
+          # number of steps was too small
+          if k == len(hist_t):
+            hist_t = np.resize(hist_t, 2*k)
+            hist_U = np.resize(hist_U, (2*k, numVars, nx+1))
+          hist_t[k] = t
+          copyto(hist_U[k], u_cur)
+          k += 1
 
         # -------------- End main MacCormack loop -------------------
+
+      self._hist_t = hist_t
+      self._hist_U = hist_U
+      self._n_hist = k
    
    
           
-if __name__=='__main__':
+def run_for_nx(nx, doPlots=False):
+  '''
+  Run the constant speed one zone problem on a grid with nx intervals, and
+  return (nx, max_err), where max_err is the largest error over all 
+  timesteps. If doPlots is True, also write plots of the solution and the
+  error at every timestep into Results/. 
+
+  This is a module-level function so that the __main__ convergence study 
+  can hand it to worker processes.
+  '''
   from one_zone_constant_speed import OneZoneConSpeed
-  from FrameWritingOutputHandler import FrameWritingOutputHandler
-
-  # Loop over grid size
-  for nx in (32, 64, 128, 256, 512):
-    grid = Grid1D(nx=nx)
-
-    model = OneZoneConSpeed()
-
-    stepper = MacCormackStepper(grid=grid, model=model)
-
-    # Set initial value to that of the known solution 
-    t_init = 0.0
-    uInit = model.exact_solution(grid.X, t_init)
-
-    # Run the simulation from t_init up to t_final
-    t_final = 0.5
-    stepper.run(t_init, t_final, uInit)
-    print('done run for nx=', nx)
-
-    doPlots = False # Change this to True to dump plots for all timesteps. That 
-    # will be slow!
-
-    # Now we'll loop over the history list, obtaining the error at each
-    # timestep and plotting both the solution and the error. We also find
-    # the maximum of the errors taken over all timesteps; that should vary as
-    # max_err = M dx^2, where M is some constant. 
-
-    max_err = 0.0
-    for i,v in enumerate(stepper.history):
-      t = v[0]
-      W = v[1]
-      Wex = model.exact_solution(grid.X, t)
-      err = Wex-W
-      err_norm = np.linalg.norm(err, 1)/nx/2
-      max_err = max(err_norm, max_err)
-
-      if doPlots:
-        fig, ax = plt.subplots()
-        ax.plot(grid.X, err[0,:], 'b-')
-        ax.plot(grid.X, err[1,:], 'r-')
-        ax.set(ylim=[-0.01,0.01])
-        ax.set_box_aspect(1)
-        plt.savefig('Results/err-{}-{}.pdf'.format(nx,i))
-        plt.close()
-
-        fig, ax = plt.subplots()
-        ax.plot(grid.X, W[0,:], 'b-')
-        ax.plot(grid.X, W[1,:], 'r-')
-        ax.plot(grid.X, Wex[0,:], 'm-')
-        ax.plot(grid.X, Wex[1,:], 'k-')
-        ax.set(ylim=[-4,4])
-        ax.set_box_aspect(1)
-        plt.savefig('Results/soln-{}-{}.pdf'.format(nx,i))
-        plt.close()
 
+  grid = Grid1D(nx=nx)
+
+  model = OneZoneConSpeed()
+
+  # MacCormack's method is second order and the errors here stay far 
+  # above single precision roundoff, so single precision is enough.
+  stepper = MacCormackStepper(grid=grid, model=model, dtype=np.float32)
+
+  # Set initial value to that of the known solution 
+  t_init = 0.0
+  uInit = model.exact_solution(grid.X, t_init)
+
+  # Run the simulation from t_init up to t_final
+  t_final = 0.5
+  stepper.run(t_init, t_final, uInit)
+  print('done run for nx=', nx)
+
+  # Now we'll obtain the error at every stored timestep at once, and find
+  # the maximum of the errors taken over all timesteps; that should vary as
+  # max_err = M dx^2, where M is some constant. The norm at each timestep 
+  # is the matrix 1-norm of err (the largest column sum of |err|), as 
+  # np.linalg.norm(err, 1) would give.
+
+  Wex_all = model.exact_solution_batch(grid.X, stepper.hist_t)
+  err_all = Wex_all - stepper.hist_U
+  err_norms = np.abs(err_all).sum(axis=1).max(axis=1)/nx/2
+  max_err = err_norms.max()
+
+  # Plot both the solution and the error at each timestep. Make one figure
+  # each for the error and solution plots, and redraw them for every 
+  # timestep rather than creating new figures. Plots are only written to 
+  # files, so use the non-interactive Agg backend. This has to be selected
+  # before pyplot is imported.
+  if doPlots:
+    import os
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    os.makedirs('Results', exist_ok=True)
+    fig_err, ax_err = plt.subplots()
+    fig_sol, ax_sol = plt.subplots()
+
+    for i in range(len(stepper.hist_t)):
+      W = stepper.hist_U[i]
+      Wex = Wex_all[i]
+      err = err_all[i]
+
+      ax_err.clear()
+      ax_err.plot(grid.X, err[0,:], 'b-')
+      ax_err.plot(grid.X, err[1,:], 'r-')
+      ax_err.set(ylim=[-0.01,0.01])
+      ax_err.set_box_aspect(1)
+      fig_err.savefig('Results/err-{}-{}.pdf'.format(nx,i))
+
+      ax_sol.clear()
+      ax_sol.plot(grid.X, W[0,:], 'b-')
+      ax_sol.plot(grid.X, W[1,:], 'r-')
+      ax_sol.plot(grid.X, Wex[0,:], 'm-')
+      ax_sol.plot(grid.X, Wex[1,:], 'k-')
+      ax_sol.set(ylim=[-4,4])
+      ax_sol.set_box_aspect(1)
+      fig_sol.savefig('Results/soln-{}-{}.pdf'.format(nx,i))
+
+    plt.close(fig_err)
+    plt.close(fig_sol)
+
+  return (nx, max_err)
+
+
+def _init_worker():
+  '''
+  Give each worker process of the convergence study a single numba 
+  thread, so the workers don't oversubscribe the cores between them.
+  '''
+  if HAVE_NUMBA:
+    import numba
+    numba.set_num_threads(1)
+
+
+if __name__=='__main__':
+  from concurrent.futures import ProcessPoolExecutor
+
+  doPlots = False # Change this to True to dump plots for all timesteps. That 
+  # will be slow!
+
+  # The runs for the different grid sizes are independent, so do them 
+  # concurrently, one process per grid size.
+  Nx = (32, 64, 128, 256, 512)
+  with ProcessPoolExecutor(max_workers=len(Nx), 
+                           initializer=_init_worker) as ex:
+    results = list(ex.map(run_for_nx, Nx, [doPlots]*len(Nx)))
+
+  for nx, max_err in results:
     print('nx={}, max_err={}'.format(nx, max_err)) 
-  
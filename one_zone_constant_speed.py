@@ -8,6 +8,9 @@ class OneZoneConSpeed(PDEModel1DWithExactSoln):
     Q_{in}cos(Omega t) and terminal resistance R.
     """
 
+    # The speed, and hence the Jacobian, is the same everywhere
+    is_constant = True
+
     def __init__(self):
         super().__init__(2)
         """Initialize constants."""
@@ -49,6 +52,23 @@ class OneZoneConSpeed(PDEModel1DWithExactSoln):
 
         return lam
 
+    def jacobians(self, X):
+        """Compute the Jacobian at every point of X in closed form"""
+        J = np.zeros((len(X), 2, 2))
+        J[:, 0, 1] = 2 * (self.speed() ** 2)
+        J[:, 1, 0] = 0.5
+
+        return J
+
+    def jacEigenvalues_all(self, X):
+        """Eigenvalues c and -c at every point of X, in closed form"""
+        c = self.speed()
+        lam = np.empty((len(X), 2))
+        lam[:, 0] = c
+        lam[:, 1] = -c
+
+        return lam
+
     def applyLeftBC(self, x, t, dx, dt, u):
         
         # Get current solution at points indexed 0 and 1
@@ -138,6 +158,28 @@ class OneZoneConSpeed(PDEModel1DWithExactSoln):
         U = np.vstack((P, Q))
         
         return U
+
+    def exact_solution_batch(self, X, t_arr):
+        """
+        Exact solution at every point of X and every time in t_arr, as a
+        T by 2 by nx+1 array. The solution separates as a function of x 
+        times exp(i Omega t), so the spatial part is evaluated once for 
+        all times.
+        """
+        i = 1.0j
+
+        d2 = np.exp(i * self.Omega * np.asarray(t_arr))[:, np.newaxis]
+        d3 = (self.A_r) / (self.rho * self.Omega)
+
+        (psi1, psi2, dpsi1, dpsi2) = self.one_zone(np.asarray(X))
+        A = self.C[0]
+        B = self.C[1]
+
+        U = np.empty((len(d2), 2, len(X)))
+        U[:, 0, :] = 2.0 * np.real((A * psi1 + B * psi2) * d2)
+        U[:, 1, :] = 2.0 * np.real(i * d3 * (A * dpsi1 + B * dpsi2) * d2)
+
+        return U
         
 
 